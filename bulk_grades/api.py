@@ -3,36 +3,75 @@ Bulk Grading API.
 """
 
 
+import csv
 import logging
-from collections import OrderedDict, defaultdict
+import uuid
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from itertools import product
 
+from celery import chord, shared_task
 from django.apps import apps
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Exists, OuterRef
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Q, Subquery
 from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
+from edx_django_utils.cache import RequestCache
+from edx_django_utils.monitoring import set_code_owner_attribute
 from lms.djangoapps.grades import api as grades_api
 from opaque_keys.edx.keys import CourseKey, UsageKey
-from openedx.core.djangoapps.course_groups.cohorts import get_cohort
-from super_csv.csv_processor import CSVProcessor, DeferrableMixin, ValidationError
+from openedx.core.djangoapps.course_groups.cohorts import is_course_cohorted
+from super_csv.csv_processor import CSVProcessor, DeferrableMixin, Echo, ValidationError
 
 from bulk_grades.clients import LearnerAPIClient
 
 from .models import ScoreOverrider
 
-__all__ = ('GradeCSVProcessor', 'ScoreCSVProcessor', 'get_score', 'get_scores', 'set_score')
+__all__ = ('GradeCSVProcessor', 'ScoreCSVProcessor', 'get_score', 'get_scores', 'set_score', 'set_scores')
 
 log = logging.getLogger(__name__)
 
 UNKNOWN_LAST_SCORE_OVERRIDER = 'unknown'
 
-
-def _get_enrollments(course_id, track=None, cohort=None, active_only=False, excluded_course_roles=None):
+# CSVOperation.operation recorded for a chunked score commit whose tasks failed; unlike 'commit', it is not in the history
+FAILED_COMMIT_OPERATION = 'commit_failed'
+# number of staged rows committed in each transaction
+BULK_WRITE_BATCH_SIZE = 500
+# number of score rows fetched from the database at a time
+SCORES_CHUNK_SIZE = 2000
+# number of enrollments (and their program enrollments) fetched from the database at a time
+ENROLLMENTS_CHUNK_SIZE = 2000
+SUBSECTIONS_CACHE_NAMESPACE = 'bulk_grades.graded_subsections'
+COURSE_GRADES_CACHE_PREFIX = 'bulk_grades.course_grade'
+GRADE_HISTORY_CACHE_PREFIX = 'bulk_grades.grade_history'
+CourseGradeSummary = namedtuple('CourseGradeSummary', ['percent', 'letter_grade'])
+# (column name, learner engagement API field) pairs for the intervention report
+INTERVENTION_ENGAGEMENT_COLUMNS = (
+    ('number of videos overall', 'videos_overall'),
+    ('number of videos last week', 'videos_last_week'),
+    ('number of problems overall', 'problems_overall'),
+    ('number of problems last week', 'problems_last_week'),
+    ('number of correct problems overall', 'correct_problems_overall'),
+    ('number of correct problems last week', 'correct_problems_last_week'),
+    ('number of problem attempts overall', 'problems_attempts_overall'),
+    ('number of problem attempts last week', 'problems_attempts_last_week'),
+    ('number of forum posts overall', 'forum_posts_overall'),
+    ('number of forum posts last week', 'forum_posts_last_week'),
+    ('date last active', 'date_last_active'),
+)
+
+
+def _get_enrollments(course_id, track=None, cohort=None, active_only=False, excluded_course_roles=None,
+                     course_grade_min=None, course_grade_max=None):
     """
     Return iterator of enrollment dictionaries.
 
+    If course_grade_min or course_grade_max (percentages) are set, learners whose
+    persisted course grade falls outside of that range are excluded.
+
     {
         'user': user object
         'user_id': user id
@@ -41,10 +80,21 @@ def _get_enrollments(course_id, track=None, cohort=None, active_only=False, excl
         'enrolled': bool
         'track': enrollment mode
         'student_uid': institution user id from program enrollment
+        'cohort': name of the learner's cohort, if the course is cohorted
     }
     """
-    enrollments = apps.get_model('student', 'CourseEnrollment').objects.filter(course_id=course_id).select_related(
-        'user').prefetch_related('programcourseenrollment_set')
+    course_enrollment = apps.get_model('student', 'CourseEnrollment')
+    # program course enrollments point at the course enrollment, so they can't be joined in;
+    # fetch them with their program enrollment's external key in one extra query.
+    # The model is reached through the relation: edx-platform keeps it in the program_enrollments app.
+    program_course_enrollment = course_enrollment._meta.get_field('programcourseenrollment').related_model
+    program_course_enrollments = program_course_enrollment.objects.select_related(
+        'program_enrollment').only('course_enrollment', 'program_enrollment__external_user_key')
+    # the whole user is handed on to the grades api, but only the name is read from the (wide) profile
+    user_fields = [f'user__{field.name}' for field in get_user_model()._meta.concrete_fields]
+    enrollments = course_enrollment.objects.filter(course_id=course_id).select_related(
+        'user', 'user__profile').only('is_active', 'mode', 'user__profile__name', *user_fields).prefetch_related(
+        Prefetch('programcourseenrollment_set', program_course_enrollments))
     if track:
         enrollments = enrollments.filter(mode=track)
     if cohort:
@@ -64,8 +114,31 @@ def _get_enrollments(course_id, track=None, cohort=None, active_only=False, excl
             apps.get_model('student', 'CourseAccessRole').objects.filter(**course_access_role_filters)
         ))
         enrollments = enrollments.exclude(has_excluded_course_role=True)
+    if course_grade_min or course_grade_max:
+        # Only learners with a persisted grade can be excluded here; everyone else
+        # is still checked against their computed course grade by the caller.
+        out_of_range = Q()
+        if course_grade_min:
+            out_of_range |= Q(percent__lt=course_grade_min)
+        if course_grade_max:
+            out_of_range |= Q(percent__gt=course_grade_max)
+        persisted_grades = apps.get_model('grades', 'PersistentCourseGrade').objects.filter(
+            user_id=OuterRef('user'),
+            course_id=course_id,
+        ).alias(percent=F('percent_grade') * 100)
+        enrollments = enrollments.annotate(has_out_of_range_course_grade=Exists(persisted_grades.filter(out_of_range)))
+        enrollments = enrollments.exclude(has_out_of_range_course_grade=True)
+    is_cohorted = is_course_cohorted(course_id)
+    if is_cohorted:
+        # read the cohort name along with the enrollment, rather than in a separate query
+        enrollments = enrollments.annotate(cohort_name=Subquery(
+            apps.get_model('course_groups', 'CohortMembership').objects.filter(
+                user_id=OuterRef('user'),
+                course_id=course_id,
+            ).values('course_user_group__name')[:1]
+        ))
 
-    for enrollment in enrollments:
+    for enrollment in enrollments.iterator(chunk_size=ENROLLMENTS_CHUNK_SIZE):
         enrollment_dict = {
             'user': enrollment.user,
             'user_id': enrollment.user.id,
@@ -73,24 +146,206 @@ def _get_enrollments(course_id, track=None, cohort=None, active_only=False, excl
             'full_name': enrollment.user.profile.name,
             'enrolled': enrollment.is_active,
             'track': enrollment.mode,
+            'cohort': enrollment.cohort_name if is_cohorted else None,
         }
-        program_course_enrollment = enrollment.programcourseenrollment_set.all()
-        if program_course_enrollment.exists():
-            program_course_enrollment = program_course_enrollment.first().program_enrollment
-            enrollment_dict['student_uid'] = program_course_enrollment.external_user_key
+        # use the prefetched list, since exists() and first() would each issue a new query
+        program_course_enrollments = list(enrollment.programcourseenrollment_set.all())
+        if program_course_enrollments:
+            program_enrollment = program_course_enrollments[0].program_enrollment
+            enrollment_dict['student_uid'] = program_enrollment.external_user_key
         else:
             enrollment_dict['student_uid'] = None
         yield enrollment_dict
 
 
-class ScoreCSVProcessor(DeferrableMixin, CSVProcessor):
+def _course_grades_version_key(course_key):
+    return f'{COURSE_GRADES_CACHE_PREFIX}.version.{course_key}'
+
+
+def _invalidate_course_grades(course_key):
+    """
+    Drop the cached course grades of every learner in the course.
+    """
+    cache.set(_course_grades_version_key(course_key), uuid.uuid4().hex, None)
+
+
+def _get_course_grades(course_key, users):
+    """
+    Return dictionary of user_id: course grade for the given users.
+
+    Grades cached by a recent export are reused (as a CourseGradeSummary) for
+    BULK_GRADES_COURSE_GRADE_CACHE_TIMEOUT seconds; the rest are read in a single
+    pass over CourseGradeFactory.iter.
+    """
+    timeout = getattr(settings, 'BULK_GRADES_COURSE_GRADE_CACHE_TIMEOUT', 0)
+    course_grades = {}
+    cache_keys = {}
+    if timeout:
+        version = cache.get_or_set(_course_grades_version_key(course_key), uuid.uuid4().hex, None)
+        cache_keys = {user.id: f'{COURSE_GRADES_CACHE_PREFIX}.{course_key}.{version}.{user.id}' for user in users}
+        cached = cache.get_many(cache_keys.values())
+        course_grades = {
+            user_id: CourseGradeSummary(*cached[key]) for user_id, key in cache_keys.items() if key in cached
+        }
+        users = [user for user in users if user.id not in course_grades]
+    read_grades = {}
+    if users:
+        for result in grades_api.CourseGradeFactory().iter(users, course_key=course_key):
+            if result.error:
+                raise result.error
+            read_grades[result.student.id] = result.course_grade
+    if timeout and read_grades:
+        cache.set_many(
+            {
+                cache_keys[user_id]: (grade.percent, grade.letter_grade)
+                for user_id, grade in read_grades.items() if grade is not None
+            },
+            timeout,
+        )
+    course_grades.update(read_grades)
+    return course_grades
+
+
+def _filter_by_course_grade(enrollments, course_grades, course_grade_min=None, course_grade_max=None):
+    """
+    Return the enrollments whose course grade percentage is within the given bounds.
+    """
+    if not (course_grade_min or course_grade_max):
+        return enrollments
+    filtered = []
+    for enrollment in enrollments:
+        course_grade_normalized = course_grades[enrollment['user_id']].percent * 100
+        if ((course_grade_min and course_grade_normalized < course_grade_min) or
+                (course_grade_max and course_grade_normalized > course_grade_max)):
+            continue
+        filtered.append(enrollment)
+    return filtered
+
+
+class ExportValuesMixin:
+    """
+    Mixin for processors whose export rows are produced as sequences of values.
+
+    ``get_export_values`` yields one sequence per row, ordered like ``get_export_columns``.
+    When the processor's columns have not been changed, plain exports write those
+    sequences straight to the CSV instead of building a dict per row.
+    """
+
+    def get_export_columns(self):
+        """
+        Return the list of columns that ``get_export_values`` produces.
+        """
+        raise NotImplementedError
+
+    def get_export_values(self):
+        """
+        Return iterator of row values to export, in the order of ``get_export_columns``.
+        """
+        raise NotImplementedError
+
+    def get_rows_to_export(self):
+        """
+        Return iterator of rows to export.
+        """
+        columns = self.get_export_columns()
+        for values in self.get_export_values():
+            yield dict(zip(columns, values))
+
+    def get_iterator(self, rows=None, columns=None, error_data=False):
+        """
+        Generate row data for writing to an output CSV file.
+        """
+        if error_data or rows is not None or columns is not None or self.columns != self.get_export_columns():
+            yield from super().get_iterator(rows=rows, columns=columns, error_data=error_data)
+            return
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.columns)
+        for values in self.get_export_values():
+            yield writer.writerow(values)
+
+
+class BulkCommitMixin:
+    """
+    Mixin to commit staged rows in batches, rather than one row at a time.
+
+    Subclasses can override process_rows to save a whole batch in one transaction;
+    otherwise each row is committed in its own savepoint.
+    """
+
+    commit_batch_size = BULK_WRITE_BATCH_SIZE
+
+    def process_rows(self, rows):  # pylint: disable=unused-argument
+        """
+        Save a batch of rows, returning a list of (status, undo) for each row.
+
+        Returns None when there is no batch write, so that the rows are committed one at a time.
+        """
+        return None
+
+    def commit_row(self, rownum, row):
+        """
+        Save a single staged row in its own savepoint, recording a failure rather than raising.
+        """
+        try:
+            with transaction.atomic():
+                return self.process_row(row)
+        except Exception as e:  # pylint: disable=broad-except
+            log.exception('Committing row %d of %r', rownum, self)
+            self.add_row_failure(str(e), rownum)
+            return False, None
+
+    def add_row_failure(self, message, rownum):
+        """
+        Record that the staged row numbered rownum failed to commit.
+        """
+        self.add_error(message, row=rownum)
+        if self.result_data:
+            self.result_data[rownum - 1]['error'] = message
+            self.result_data[rownum - 1]['status'] = _('Failure')
+
+    def commit(self):
+        """
+        Commit the staged rows to the database.
+        """
+        self.commit_rows()
+
+    def commit_rows(self):
+        """
+        Commit the staged rows to the database, a batch at a time.
+
+        If a batch fails, its writes are rolled back and its rows are committed one at a time,
+        so only the rows which fail on their own are marked as failed.
+        """
+        saved = 0
+        while self.stage:
+            batch = self.stage[:self.commit_batch_size]
+            del self.stage[:self.commit_batch_size]
+            try:
+                with transaction.atomic():
+                    results = self.process_rows([row for _, row in batch])
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Committing a batch of %r, retrying its rows one at a time', self)
+                results = None
+            if results is None:
+                results = [self.commit_row(rownum, row) for rownum, row in batch]
+            for (rownum, _), (did_save, undo) in zip(batch, results):
+                if did_save:
+                    saved += 1
+                    if undo:
+                        self.rollback_rows.append((rownum, undo))
+        self.saved_rows = saved
+        log.info('%r committed %d rows', self, saved)
+
+
+class ScoreCSVProcessor(DeferrableMixin, BulkCommitMixin, ExportValuesMixin, CSVProcessor):
     """
     CSV Processor for file format defined for Staff Graded Points.
     """
 
-    columns = ['user_id', 'username', 'full_name', 'student_uid',
-               'enrolled', 'track', 'cohort', 'block_id', 'title', 'date_last_graded',
-               'who_last_graded', 'Previous Points', 'New Points']
+    export_columns = ('user_id', 'username', 'full_name', 'student_uid',
+                      'enrolled', 'track', 'cohort', 'block_id', 'title', 'date_last_graded',
+                      'who_last_graded', 'Previous Points', 'New Points')
+    columns = list(export_columns)
     required_columns = ['user_id', 'New Points', 'block_id', 'Previous Points']
 
     # files larger than 100 rows will be processed asynchronously
@@ -110,6 +365,13 @@ class ScoreCSVProcessor(DeferrableMixin, CSVProcessor):
         super().__init__(**kwargs)
         self._users_seen = set()
 
+    @cached_property
+    def _usage_key(self):
+        """
+        The parsed block_id, shared by every row of the file.
+        """
+        return UsageKey.from_string(self.block_id)
+
     def get_unique_path(self):
         """
         Return a unique id for CSVOperations.
@@ -156,63 +418,188 @@ class ScoreCSVProcessor(DeferrableMixin, CSVProcessor):
         undo is a dict of an operation which would undo the set_score. In this case,
         that means we would have to call get_score, which could be expensive to do for the entire file.
         """
+        undo = None
         if self.handle_undo:
             # get the current score, for undo. expensive
-            undo = get_score(row['block_id'], row['user_id'])
-            undo['new_points'] = undo['score']
-            undo['max_points'] = row['max_points']
-        else:
-            undo = None
-        set_score(row['block_id'], row['user_id'], row['new_points'], row['max_points'], row['override_user_id'])
+            undo = get_score(self._usage_key, row['user_id'])
+            if undo:
+                undo = dict(undo, new_points=undo['score'], max_points=row['max_points'])
+        # validate_row ensures that every row is for this processor's block
+        set_score(self._usage_key, row['user_id'], row['new_points'], row['max_points'], row['override_user_id'])
         return True, undo
 
-    def get_rows_to_export(self):
+    def process_rows(self, rows):
+        """
+        Set the scores for a batch of rows in a single transaction.
+
+        When handling undo, the current scores of the whole batch are read with a single query.
+        """
+        previous_scores = {}
+        if self.handle_undo:
+            previous_scores = get_scores(self._usage_key, [row['user_id'] for row in rows])
+        batches = defaultdict(dict)
+        for row in rows:
+            batches[(row['max_points'], row['override_user_id'])][row['user_id']] = row['new_points']
+        for (max_points, override_user_id), scores in batches.items():
+            set_scores(self._usage_key, scores, max_points, override_user_id=override_user_id)
+        results = []
+        for row in rows:
+            undo = previous_scores.get(int(row['user_id']))
+            if undo:
+                undo = dict(undo, new_points=undo['score'], max_points=row['max_points'])
+            results.append((True, undo))
+        return results
+
+    def get_export_columns(self):
+        """
+        Return the list of columns that ``get_export_values`` produces.
+        """
+        return list(self.export_columns)
+
+    def get_export_values(self):
         """
-        Return iterator of rows for file export.
+        Return iterator of row values for file export.
         """
-        location = UsageKey.from_string(self.block_id)
+        location = self._usage_key
         my_name = self.display_name
 
-        students = get_scores(location)
+        students = get_scores(location, include_state=False)
         course_key = location.course_key
         enrollments = _get_enrollments(course_key,
                                        track=self.track,
                                        cohort=self.cohort)
         for enrollment in enrollments:
-            cohort = get_cohort(enrollment['user'], course_key, assign=False)
-            row = {
-                'block_id': location,
-                'title': my_name,
-                'New Points': None,
-                'Previous Points': None,
-                'date_last_graded': None,
-                'who_last_graded': None,
-                'user_id': enrollment['user_id'],
-                'username': enrollment['username'],
-                'full_name': enrollment['full_name'],
-                'student_uid': enrollment['student_uid'],
-                'enrolled': enrollment['enrolled'],
-                'track': enrollment['track'],
-                'cohort': cohort.name if cohort else None,
-            }
             score = students.get(enrollment['user_id'], None)
-
             if score:
-                row['Previous Points'] = float(score['score'])
-                row['date_last_graded'] = score['modified'].strftime('%Y-%m-%d %H:%M')
-                row['who_last_graded'] = score['who_last_graded']
-            yield row
+                previous_points = float(score['score'])
+                # same as strftime('%Y-%m-%d %H:%M') without parsing a format for every row
+                date_last_graded = score['modified'].replace(tzinfo=None).isoformat(' ', 'minutes')
+                who_last_graded = score['who_last_graded']
+            else:
+                previous_points = date_last_graded = who_last_graded = None
+            yield (
+                enrollment['user_id'],
+                enrollment['username'],
+                enrollment['full_name'],
+                enrollment['student_uid'],
+                enrollment['enrolled'],
+                enrollment['track'],
+                enrollment['cohort'],
+                location,
+                my_name,
+                date_last_graded,
+                who_last_graded,
+                previous_points,
+                None,
+            )
 
     def commit(self, running_task=None):
         """
         Commit the data and trigger course grade recalculation.
+
+        Uploads too large to commit synchronously are split into chunks,
+        which are committed in parallel by celery tasks.
         """
+        if not running_task and not self.handle_undo and len(self.stage) > self.size_to_defer:
+            self._defer_commit_in_chunks()
+            return
         super().commit(running_task=running_task)
         if running_task or not self.status()['waiting']:
-            # after commit, trigger grade recomputation for the course.
-            # not sure if this is necessary
-            course_key = UsageKey.from_string(self.block_id).course_key
-            grades_api.task_compute_all_grades_for_course.apply_async(kwargs={'course_key': str(course_key)})
+            self.compute_course_grades()
+
+    def compute_course_grades(self):
+        """
+        Trigger grade recomputation for the course, after scores have been committed.
+        """
+        # not sure if this is necessary
+        course_key = self._usage_key.course_key
+        _invalidate_course_grades(course_key)
+        grades_api.task_compute_all_grades_for_course.apply_async(kwargs={'course_key': str(course_key)})
+
+    def _defer_commit_in_chunks(self):
+        """
+        Enqueue a celery task per chunk of staged rows, followed by a task that combines the results.
+        """
+        try:
+            with transaction.atomic():
+                # the tasks load this operation, so it must be committed before they start
+                operation = self.save()
+        except DatabaseError:
+            log.exception('Error saving ScoreCSVProcessor: %s', self)
+            raise
+
+        chunks = [
+            self.stage[start:start + self.commit_batch_size]
+            for start in range(0, len(self.stage), self.commit_batch_size)
+        ]
+        finish = finish_score_commit.s(operation.id)
+        finish.link_error(fail_score_commit.s(operation.id))
+        result = chord(commit_score_chunk.s(self.block_id, chunk) for chunk in chunks)(finish)
+        if not result.ready():
+            self.result_id = result.id
+            log.info('Queued %d chunks for %s %r', len(chunks), operation.id, result)
+        else:
+            self._status = result.get()
+
+
+def _load_finished_score_commit(operation_id):
+    """
+    Load the saved ScoreCSVProcessor operation whose chunked commit has ended.
+    """
+    processor = ScoreCSVProcessor.load(operation_id)
+    processor.stage = []
+    # saved state turns error_messages into a plain dict
+    processor.error_messages = defaultdict(list, processor.error_messages)
+    return processor
+
+
+@shared_task
+@set_code_owner_attribute
+def commit_score_chunk(block_id, staged_rows):
+    """
+    Commit a chunk of staged rows for a ScoreCSVProcessor of block_id.
+
+    Returns the number of saved rows and a dictionary of error message: row numbers.
+    """
+    processor = ScoreCSVProcessor(block_id=block_id, stage=staged_rows)
+    # write the rows directly, rather than going through commit(), which would queue them again
+    processor.commit_rows()
+    return {'saved': processor.saved_rows, 'errors': dict(processor.error_messages)}
+
+
+@shared_task
+@set_code_owner_attribute
+def finish_score_commit(chunk_results, operation_id):
+    """
+    Combine the results of commit_score_chunk tasks into the saved ScoreCSVProcessor operation.
+    """
+    processor = _load_finished_score_commit(operation_id)
+    processor.saved_rows = sum(chunk_result['saved'] for chunk_result in chunk_results)
+    for chunk_result in chunk_results:
+        for message, rownums in chunk_result['errors'].items():
+            for rownum in rownums:
+                processor.add_row_failure(message, rownum)
+    log.info('%r committed %d rows', processor, processor.saved_rows)
+    processor.compute_course_grades()
+    status = processor.status()
+    processor.save()
+    return status
+
+
+@shared_task
+@set_code_owner_attribute
+def fail_score_commit(request, exc, traceback, operation_id):  # pylint: disable=unused-argument
+    """
+    Record on the saved ScoreCSVProcessor operation that its chunked commit failed.
+
+    Celery calls this errback when a commit_score_chunk or finish_score_commit task raises.
+    """
+    log.error('Committing scores for operation %s failed: %r', operation_id, exc)
+    processor = _load_finished_score_commit(operation_id)
+    processor.add_error(_('Saving the scores failed; some scores may not have been saved: {}').format(exc))
+    # chunks that did finish may have changed scores
+    processor.compute_course_grades()
+    processor.save(FAILED_COMMIT_OPERATION)
 
 
 class GradedSubsectionMixin:
@@ -227,9 +614,23 @@ class GradedSubsectionMixin:
         if the item is not already contained therein.
         """
         current_columns = set(self.columns)
-        for new_column_name in new_column_names:
-            if new_column_name not in current_columns:
-                self.columns.append(new_column_name)
+        self.columns.extend(name for name in new_column_names if name not in current_columns)
+
+    @staticmethod
+    def _get_course_graded_subsections(course_id):
+        """
+        Return the graded subsections of the course, cached for the current request.
+
+        Walking the course structure is expensive, and a single request or task
+        may build several processors for the same course.
+        """
+        request_cache = RequestCache(SUBSECTIONS_CACHE_NAMESPACE)
+        cached_response = request_cache.get_cached_response(str(course_id))
+        if cached_response.is_found:
+            return cached_response.value
+        subsections = list(grades_api.graded_subsections_for_course_id(course_id))
+        request_cache.set(str(course_id), subsections)
+        return subsections
 
     @staticmethod
     def _get_graded_subsections(course_id, filter_subsection=None, filter_assignment_type=None):
@@ -239,14 +640,17 @@ class GradedSubsectionMixin:
         If filter_subsection (block usage id) is set, return only that subsection.
         If filter_assignment_type (string) is set, return only subsections of the appropriate type.
         """
-        subsections = OrderedDict()
-        for subsection in grades_api.graded_subsections_for_course_id(course_id):
+        subsections = {}
+        for subsection in GradedSubsectionMixin._get_course_graded_subsections(course_id):
             block_id = str(subsection.location.block_id)
-            if (  # pragma: no branch
-                    (filter_subsection and (block_id != filter_subsection.block_id))
-                    or
-                    (filter_assignment_type and (filter_assignment_type != str(subsection.format)))
-            ):
+            if filter_subsection:
+                if block_id != filter_subsection.block_id:
+                    continue
+                if not filter_assignment_type or filter_assignment_type == str(subsection.format):
+                    subsections[block_id[:8]] = (subsection, subsection.display_name)
+                # a block id identifies a single subsection, so there is nothing left to find
+                break
+            if filter_assignment_type and (filter_assignment_type != str(subsection.format)):
                 continue  # pragma: no cover
             short_block_id = block_id[:8]
             if short_block_id not in subsections:
@@ -272,12 +676,13 @@ def decode_utf8(input_iterator):
         yield line if isinstance(line, str) else line.decode('utf-8')
 
 
-class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
+class GradeCSVProcessor(DeferrableMixin, BulkCommitMixin, ExportValuesMixin, GradedSubsectionMixin, CSVProcessor):
     """
     CSV Processor for subsection grades.
     """
 
     required_columns = ['user_id', 'course_id']
+    enrollment_columns = ('user_id', 'username', 'student_key', 'course_id', 'track', 'cohort')
     subsection_prefixes = ('name', 'grade', 'original_grade', 'previous_override', 'new_override',)
 
     def __init__(self, **kwargs):
@@ -285,7 +690,7 @@ class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
         Create GradeCSVProcessor.
         """
         # First, set some default values.
-        self.columns = ['user_id', 'username', 'student_key', 'course_id', 'track', 'cohort']
+        self.columns = list(self.enrollment_columns)
         self.course_id = None
         self.subsection_grade_max = None
         self.subsection_grade_min = None
@@ -310,12 +715,25 @@ class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
             filter_subsection=self._subsection,
             filter_assignment_type=kwargs.get('assignment_type', None),
         )
+        # resolved once, since exports look these up for every learner
+        self._subsection_locations = [
+            (subsection.location, display_name) for subsection, display_name in self._subsections.values()
+        ]
         self.append_columns(
             self._subsection_column_names(
                 self._subsections.keys(),  # pylint: disable=useless-suppression
                 self.subsection_prefixes
             )
         )
+        # the override columns are fixed by the subsections, so resolve their blocks once
+        self._override_blocks = {
+            f'new_override-{short_id}': str(subsection.location)
+            for short_id, (subsection, _) in self._subsections.items()
+        }
+        # staged rows keep block ids as strings, so map them back to the parsed keys
+        self._subsection_usage_keys = {
+            str(subsection.location): subsection.location for subsection, _ in self._subsections.values()
+        }
         self._users_seen = defaultdict(list)
         self._row_num = 0
 
@@ -329,8 +747,12 @@ class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
         """
         Saves the operation state for this processor, including the user
         who is performing the operation.
+
+        Saving after a commit records it in the history, so the cached history is dropped.
         """
-        return super().save(operating_user=self._user)
+        operation = super().save(operating_user=self._user)
+        cache.delete(f'{GRADE_HISTORY_CACHE_PREFIX}.{self.course_id}')
+        return operation
 
     def get_unique_path(self):
         """
@@ -338,6 +760,31 @@ class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
         """
         return self.course_id
 
+    def commit(self, running_task=None):
+        """
+        Commit the staged overrides, then drop the course grades and history cached by earlier requests.
+        """
+        super().commit(running_task=running_task)
+        _invalidate_course_grades(self._course_key)
+        cache.delete(f'{GRADE_HISTORY_CACHE_PREFIX}.{self.course_id}')
+
+    def get_committed_history(self):
+        """
+        Get the history of committed uploads for the course.
+
+        The history only changes when an upload is committed, so it is cached
+        for BULK_GRADES_HISTORY_CACHE_TIMEOUT seconds, or until the next commit.
+        """
+        timeout = getattr(settings, 'BULK_GRADES_HISTORY_CACHE_TIMEOUT', 0)
+        if not timeout:
+            return super().get_committed_history()
+        cache_key = f'{GRADE_HISTORY_CACHE_PREFIX}.{self.course_id}'
+        history = cache.get(cache_key)
+        if history is None:
+            history = list(super().get_committed_history())
+            cache.set(cache_key, history, timeout)
+        return history
+
     def validate_row(self, row):
         """
         Validate row.
@@ -372,21 +819,17 @@ class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
         operation['course_id'] = self.course_id
         operation['user_id'] = user_id
 
-        for key in row:
-            if key.startswith('new_override-'):
-                value = row[key].strip()
-                if value:
-                    short_id = key.split('-', 1)[1]
-                    subsection = self._subsections[short_id][0]
-                    block_id = str(subsection.location)
-                    try:
-                        new_grade = float(value)
-                    except ValueError as error:
-                        raise ValidationError(_('Grade must be a number')) from error
+        for key, block_id in self._override_blocks.items():
+            value = (row.get(key) or '').strip()
+            if value:
+                try:
+                    new_grade = float(value)
+                except ValueError as error:
+                    raise ValidationError(_('Grade must be a number')) from error
 
-                    if new_grade < 0:
-                        raise ValidationError(_('Grade must not be negative'))
-                    operation['new_override_grades'].append((block_id, new_grade))
+                if new_grade < 0:
+                    raise ValidationError(_('Grade must not be negative'))
+                operation['new_override_grades'].append((block_id, new_grade))
 
         return operation
 
@@ -394,11 +837,12 @@ class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
         """
         Save a row to the persistent subsection override table.
         """
+        # validate_row ensures that every row is for this processor's course
         for block_id, new_grade in row['new_override_grades']:
             grades_api.override_subsection_grade(
                 row['user_id'],
-                row['course_id'],
-                block_id,
+                self._course_key,
+                self._subsection_usage_keys.get(block_id, block_id),
                 overrider=self._user,
                 earned_graded=new_grade,
                 feature='grade-import',
@@ -407,9 +851,17 @@ class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
 
         return True, None
 
-    def get_rows_to_export(self):
+    def get_export_columns(self):
         """
-        Return iterator of rows to export.
+        Return the list of columns that ``get_export_values`` produces.
+        """
+        return list(self.enrollment_columns) + self._subsection_column_names(
+            self._subsections.keys(), self.subsection_prefixes
+        )
+
+    def get_export_values(self):
+        """
+        Return iterator of row values to export.
         """
         enrollments = list(_get_enrollments(
             self._course_key,
@@ -417,26 +869,31 @@ class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
             cohort=self.cohort,
             active_only=self.active_only,
             excluded_course_roles=self.excluded_course_roles,
+            course_grade_min=self.course_grade_min,
+            course_grade_max=self.course_grade_max,
         ))
         enrolled_users = [enroll['user'] for enroll in enrollments]
 
         grades_api.prefetch_course_and_subsection_grades(self._course_key, enrolled_users)
+        # the export has no course grade column, so course grades are only read to filter on them
+        if self.course_grade_min or self.course_grade_max:
+            course_grades = _get_course_grades(self._course_key, enrolled_users)
+            # drop learners outside the course grade bounds before reading any of their subsection grades
+            enrollments = _filter_by_course_grade(
+                enrollments, course_grades, self.course_grade_min, self.course_grade_max
+            )
 
+        filter_location = None
+        if self._subsection and (self.subsection_grade_max or self.subsection_grade_min):
+            filter_location = self._subsections[self._subsection.block_id[:8]][0].location
         for enrollment in enrollments:
-            cohort = get_cohort(enrollment['user'], self._course_key, assign=False)
-            row = {
-                'user_id': enrollment['user_id'],
-                'username': enrollment['username'],
-                'student_key': enrollment['student_uid'] if enrollment['track'] == 'masters' else None,
-                'track': enrollment['track'],
-                'course_id': self.course_id,
-                'cohort': cohort.name if cohort else None,
-            }
-            grades = grades_api.get_subsection_grades(enrollment['user_id'], self._course_key)
-            if self._subsection and (self.subsection_grade_max or self.subsection_grade_min):
-                short_id = self._subsection.block_id[:8]
-                (filtered_subsection, _) = self._subsections[short_id]
-                subsection_grade = grades.get(filtered_subsection.location, None)
+            # served from the prefetch above, and not needed when there are no subsection columns
+            if self._subsection_locations:
+                grades = grades_api.get_subsection_grades(enrollment['user_id'], self._course_key)
+            else:
+                grades = {}
+            if filter_location is not None:
+                subsection_grade = grades.get(filter_location, None)
                 if not subsection_grade:
                     continue
                 try:
@@ -450,26 +907,26 @@ class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
                         (self.subsection_grade_max and (effective_grade > self.subsection_grade_max))
                 ):
                     continue
-            # pylint: disable=E1111
-            course_grade = grades_api.CourseGradeFactory().read(enrollment['user'], course_key=self._course_key)
-            course_grade_normalized = course_grade.percent * 100
-
-            if ((self.course_grade_min and course_grade_normalized < self.course_grade_min) or
-                    (self.course_grade_max and course_grade_normalized > self.course_grade_max)):
-                continue
-
-            for block_id, (subsection, display_name) in self._subsections.items():
-                row[f'name-{block_id}'] = display_name
-                grade = grades.get(subsection.location, None)
+            # the enrollment columns, then for each subsection
+            # its name, grade, original_grade, previous_override and new_override
+            row = [
+                enrollment['user_id'],
+                enrollment['username'],
+                enrollment['student_uid'] if enrollment['track'] == 'masters' else None,
+                self.course_id,
+                enrollment['track'],
+                enrollment['cohort'],
+            ]
+            for location, display_name in self._subsection_locations:
+                grade = grades.get(location, None)
                 if grade:
-                    effective_grade = grade.earned_graded
-                    row[f'original_grade-{block_id}'] = grade.earned_graded
                     try:
-                        effective_grade = grade.override.earned_graded_override
-                        row[f'previous_override-{block_id}'] = grade.override.earned_graded_override
+                        previous_override = effective_grade = grade.override.earned_graded_override
                     except AttributeError:
-                        row[f'previous_override-{block_id}'] = None
-                    row[f'grade-{block_id}'] = effective_grade
+                        previous_override, effective_grade = None, grade.earned_graded
+                    row.extend((display_name, effective_grade, grade.earned_graded, previous_override, None))
+                else:
+                    row.extend((display_name, None, None, None, None))
             yield row
 
     def filtered_column_headers(self):
@@ -504,28 +961,22 @@ class GradeCSVProcessor(DeferrableMixin, GradedSubsectionMixin, CSVProcessor):
         return columns
 
 
-class InterventionCSVProcessor(GradedSubsectionMixin, CSVProcessor):
+class InterventionCSVProcessor(ExportValuesMixin, GradedSubsectionMixin, CSVProcessor):
     """
     CSV Processor for intervention report grades for masters track only.
     """
 
     MASTERS_TRACK = 'masters'
+    enrollment_columns = ('user_id', 'username', 'email', 'student_key', 'full_name', 'course_id', 'track', 'cohort')
     subsection_prefixes = ('name', 'grade',)
+    course_grade_columns = ('course grade letter', 'course grade numeric')
 
     def __init__(self, **kwargs):
         """
         Create InterventionCSVProcessor.
         """
         # Set some default values for the attributes below
-        self.columns = [
-            'user_id', 'username', 'email', 'student_key', 'full_name', 'course_id', 'track', 'cohort',
-            'number of videos overall', 'number of videos last week', 'number of problems overall',
-            'number of problems last week',
-            'number of correct problems overall', 'number of correct problems last week',
-            'number of problem attempts overall', 'number of problem attempts last week',
-            'number of forum posts overall', 'number of forum posts last week',
-            'date last active',
-        ]
+        self.columns = list(self.enrollment_columns) + [column for column, _ in INTERVENTION_ENGAGEMENT_COLUMNS]
         self.course_id = None
         self.cohort = None
         self.subsection = None
@@ -547,29 +998,67 @@ class InterventionCSVProcessor(GradedSubsectionMixin, CSVProcessor):
             filter_subsection=self._subsection,
             filter_assignment_type=self.assignment_type,
         )
+        # resolved once, since exports look these up for every learner
+        self._subsection_locations = [
+            (subsection.location, display_name) for subsection, display_name in self._subsections.values()
+        ]
         self.append_columns(
             self._subsection_column_names(
                 self._subsections.keys(),  # pylint: disable=useless-suppression
                 self.subsection_prefixes
             )
         )
-        self.append_columns(('course grade letter', 'course grade numeric'))
+        self.append_columns(self.course_grade_columns)
 
-    def get_rows_to_export(self):
+    def get_export_columns(self):
         """
-        Return iterator of rows to export.
+        Return the list of columns that ``get_export_values`` produces.
+        """
+        return (
+            list(self.enrollment_columns)
+            + [column for column, _ in INTERVENTION_ENGAGEMENT_COLUMNS]
+            + self._subsection_column_names(self._subsections.keys(), self.subsection_prefixes)
+            + list(self.course_grade_columns)
+        )
+
+    def get_export_values(self):
+        """
+        Return iterator of row values to export.
         """
-        enrollments = list(_get_enrollments(self._course_key, track=self.MASTERS_TRACK, cohort=self.cohort))
-        grades_api.prefetch_course_and_subsection_grades(self._course_key, [enroll['user'] for enroll in enrollments])
+        enrollments = list(_get_enrollments(
+            self._course_key,
+            track=self.MASTERS_TRACK,
+            cohort=self.cohort,
+            course_grade_min=self.course_grade_min,
+            course_grade_max=self.course_grade_max,
+        ))
+        enrolled_users = [enroll['user'] for enroll in enrollments]
         client = LearnerAPIClient()
-        intervention_list = client.courses(self.course_id).user_engagement().get()
-        intervention_data = {val['username']: val for val in intervention_list}
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # fetch engagement data while grades are prefetched. The prefetch stays on this
+            # thread, since it fills this thread's request cache and uses its db connection.
+            engagement = executor.submit(client.courses(self.course_id).user_engagement().get)
+            grades_api.prefetch_course_and_subsection_grades(self._course_key, enrolled_users)
+            intervention_list = engagement.result()
+        # resolve each learner's engagement values once, rather than field by field in every row
+        intervention_data = {
+            val['username']: tuple(val.get(field, 0) for _, field in INTERVENTION_ENGAGEMENT_COLUMNS)
+            for val in intervention_list
+        }
+        no_intervention_data = (0,) * len(INTERVENTION_ENGAGEMENT_COLUMNS)
+        course_grades = _get_course_grades(self._course_key, enrolled_users)
+        enrollments = _filter_by_course_grade(enrollments, course_grades, self.course_grade_min, self.course_grade_max)
+        filter_location = None
+        if self._subsection and (self.subsection_grade_max or self.subsection_grade_min):
+            filter_location = self._subsections[self._subsection.block_id[:8]][0].location
         for enrollment in enrollments:
-            grades = grades_api.get_subsection_grades(enrollment['user_id'], self._course_key)
-            if self._subsection and (self.subsection_grade_max or self.subsection_grade_min):
-                short_id = self._subsection.block_id[:8]
-                (filtered_subsection, _) = self._subsections[short_id]
-                subsection_grade = grades.get(filtered_subsection.location, None)
+            # served from the prefetch above, and not needed when there are no subsection columns
+            if self._subsection_locations:
+                grades = grades_api.get_subsection_grades(enrollment['user_id'], self._course_key)
+            else:
+                grades = {}
+            if filter_location is not None:
+                subsection_grade = grades.get(filter_location, None)
                 if not subsection_grade:
                     continue
                 try:
@@ -583,51 +1072,26 @@ class InterventionCSVProcessor(GradedSubsectionMixin, CSVProcessor):
                         (self.subsection_grade_max and (effective_grade > self.subsection_grade_max))
                 ):
                     continue
-            # pylint: disable=E1111
-            course_grade = grades_api.CourseGradeFactory().read(enrollment['user'], course_key=self._course_key)
-            if self.course_grade_min or self.course_grade_max:
-                course_grade_normalized = course_grade.percent * 100
-
-                if (
-                        (self.course_grade_min and (course_grade_normalized < self.course_grade_min))
-                        or
-                        (self.course_grade_max and (course_grade_normalized > self.course_grade_max))
-                ):
-                    continue
-
-            cohort = get_cohort(enrollment['user'], self._course_key, assign=False)
-            int_user = intervention_data.get(enrollment['user'].username, {})
-            row = {
-                'user_id': enrollment['user_id'],
-                'username': enrollment['username'],
-                'email': enrollment['user'].email,
-                'student_key': enrollment['student_uid'],
-                'full_name': enrollment['full_name'],
-                'track': enrollment['track'],
-                'course_id': self.course_id,
-                'cohort': cohort.name if cohort else None,
-                'number of videos overall': int_user.get('videos_overall', 0),
-                'number of videos last week': int_user.get('videos_last_week', 0),
-                'number of problems overall': int_user.get('problems_overall', 0),
-                'number of problems last week': int_user.get('problems_last_week', 0),
-                'number of correct problems overall': int_user.get('correct_problems_overall', 0),
-                'number of correct problems last week': int_user.get('correct_problems_last_week', 0),
-                'number of problem attempts overall': int_user.get('problems_attempts_overall', 0),
-                'number of problem attempts last week': int_user.get('problems_attempts_last_week', 0),
-                'number of forum posts overall': int_user.get('forum_posts_overall', 0),
-                'number of forum posts last week': int_user.get('forum_posts_last_week', 0),
-                'date last active': int_user.get('date_last_active', 0),
-                'course grade letter': course_grade.letter_grade,
-                'course grade numeric': course_grade.percent
-            }
-            for block_id, (subsection, display_name) in self._subsections.items():
-                row[f'name-{block_id}'] = display_name
-                grade = grades.get(subsection.location, None)
-                if grade:
-                    if getattr(grade, 'override', None):
-                        row[f'grade-{block_id}'] = grade.override.earned_graded_override
-                    else:
-                        row[f'grade-{block_id}'] = grade.earned_graded
+            course_grade = course_grades[enrollment['user_id']]
+            # the enrollment and engagement columns, a name and grade per subsection, then the course grade
+            row = [
+                enrollment['user_id'],
+                enrollment['username'],
+                enrollment['user'].email,
+                enrollment['student_uid'],
+                enrollment['full_name'],
+                self.course_id,
+                enrollment['track'],
+                enrollment['cohort'],
+            ]
+            row.extend(intervention_data.get(enrollment['username'], no_intervention_data))
+            for location, display_name in self._subsection_locations:
+                grade = grades.get(location, None)
+                if grade and getattr(grade, 'override', None):
+                    row.extend((display_name, grade.override.earned_graded_override))
+                else:
+                    row.extend((display_name, grade.earned_graded if grade else None))
+            row.extend((course_grade.letter_grade, course_grade.percent))
             yield row
 
 
@@ -653,6 +1117,23 @@ def set_score(usage_key, student_id, score, max_points, override_user_id=None, *
             user_id=override_user_id)
 
 
+def set_scores(usage_key, scores, max_points, override_user_id=None):
+    """
+    Set the scores of many students for a block at once.
+
+    scores is a dictionary of student_id: score. The scores are saved one at a time,
+    so that the platform's StudentModule signal handlers (such as its history) still run,
+    but in a single transaction.
+    """
+    if not isinstance(usage_key, UsageKey):
+        usage_key = UsageKey.from_string(usage_key)
+    if any(score < 0 for score in scores.values()):
+        raise ValueError(_('score must be positive'))
+    with transaction.atomic():
+        for student_id, score in scores.items():
+            set_score(usage_key, student_id, score, max_points, override_user_id=override_user_id)
+
+
 def get_score(usage_key, user_id):
     """
     Return score for user_id and usage_key.
@@ -663,9 +1144,11 @@ def get_score(usage_key, user_id):
         return None
 
 
-def get_scores(usage_key, user_ids=None):
+def get_scores(usage_key, user_ids=None, include_state=True):
     """
     Return dictionary of student_id: scores.
+
+    Set include_state to False to leave out the (potentially large) module state.
     """
     if not isinstance(usage_key, UsageKey):
         usage_key = UsageKey.from_string(usage_key)
@@ -675,20 +1158,25 @@ def get_scores(usage_key, user_ids=None):
     )
     if user_ids:
         scores_qset = scores_qset.filter(student_id__in=user_ids)
+    scores_qset = scores_qset.annotate(who_last_graded=Subquery(
+        ScoreOverrider.objects.filter(module=OuterRef('pk')).order_by('-created', '-id').values('user__username')[:1]
+    ))
+
+    # stream plain values, since the modules are only read once and never saved
+    fields = ['student_id', 'grade', 'max_grade', 'created', 'modified', 'who_last_graded']
+    if include_state:
+        fields.append('state')
+    rows = scores_qset.values(*fields).iterator(chunk_size=SCORES_CHUNK_SIZE)
 
     scores = {}
-    for row in scores_qset:
-        scores[row.student_id] = {
-            'score': row.grade,
-            'max_grade': row.max_grade,
-            'created': row.created,
-            'modified': row.modified,
-            'state': row.state,
+    for row in rows:
+        scores[row['student_id']] = {
+            'score': row['grade'],
+            'max_grade': row['max_grade'],
+            'created': row['created'],
+            'modified': row['modified'],
+            'who_last_graded': row['who_last_graded'] or UNKNOWN_LAST_SCORE_OVERRIDER,
         }
-        try:
-            last_override = row.scoreoverrider_set.select_related('user').latest('created')
-        except ObjectDoesNotExist:
-            scores[row.student_id]['who_last_graded'] = UNKNOWN_LAST_SCORE_OVERRIDER
-        else:
-            scores[row.student_id]['who_last_graded'] = last_override.user.username
+        if include_state:
+            scores[row['student_id']]['state'] = row['state']
     return scores
@@ -28,6 +28,24 @@ class TokenAuth(requests.auth.AuthBase):
         return r
 
 
+class TimeoutSession(requests.Session):
+    """A requests session which applies a default timeout to every request."""
+
+    def __init__(self, timeout):
+        """
+        Constructor.
+        """
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, *args, **kwargs):  # pylint: disable=arguments-differ
+        """
+        Send the request, giving up after ``timeout`` seconds unless told otherwise.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, *args, **kwargs)
+
+
 class TextSerializer(serialize.BaseSerializer):
     """
     Slumber API Serializer for text data, e.g. CSV.
@@ -51,8 +69,8 @@ class LearnerAPIClient(API):
         """
         Constructor.
         """
-        session = requests.session()
-        session.timeout = timeout
+        # requests ignores a timeout set on a plain session, so apply it to each request
+        session = TimeoutSession(timeout)
 
         serializers = serialize.Serializer(
             default=serializer_type,
@@ -11,3 +11,10 @@ def plugin_settings(settings):
         'url': 'http://host.docker.internal:8000/api/v0',
         'token': 'edx'
     }
+    # seconds that exports may reuse learners' course grades, which can then lag behind
+    # recent grade changes; off (0) unless a deployment opts in
+    settings.BULK_GRADES_COURSE_GRADE_CACHE_TIMEOUT = 0
+    # seconds that a course's grade override history may be reused; 0 disables the cache
+    settings.BULK_GRADES_HISTORY_CACHE_TIMEOUT = 60
+    # characters of CSV written to the response at a time by exports; match it to the server's write buffer
+    settings.BULK_GRADES_EXPORT_CHUNK_SIZE = 64 * 1024
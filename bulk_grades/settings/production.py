@@ -13,3 +13,9 @@ def plugin_settings(settings):
         settings.ANALYTICS_API_CLIENT['url'] = env_tokens['ANALYTICS_API_URL']
     if auth_tokens.get('ANALYTICS_API_KEY'):
         settings.ANALYTICS_API_CLIENT['token'] = auth_tokens['ANALYTICS_API_KEY']
+    if 'BULK_GRADES_COURSE_GRADE_CACHE_TIMEOUT' in env_tokens:
+        settings.BULK_GRADES_COURSE_GRADE_CACHE_TIMEOUT = env_tokens['BULK_GRADES_COURSE_GRADE_CACHE_TIMEOUT']
+    if 'BULK_GRADES_HISTORY_CACHE_TIMEOUT' in env_tokens:
+        settings.BULK_GRADES_HISTORY_CACHE_TIMEOUT = env_tokens['BULK_GRADES_HISTORY_CACHE_TIMEOUT']
+    if 'BULK_GRADES_EXPORT_CHUNK_SIZE' in env_tokens:
+        settings.BULK_GRADES_EXPORT_CHUNK_SIZE = env_tokens['BULK_GRADES_EXPORT_CHUNK_SIZE']
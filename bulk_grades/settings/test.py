@@ -9,3 +9,5 @@ def plugin_settings(settings):
         'url': 'mock',
         'token': 'edx'
     }
+    settings.BULK_GRADES_COURSE_GRADE_CACHE_TIMEOUT = 0
+    settings.BULK_GRADES_HISTORY_CACHE_TIMEOUT = 0
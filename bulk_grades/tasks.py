@@ -0,0 +1,6 @@
+"""
+Celery tasks for bulk_grades.
+"""
+
+# pylint: disable=unused-import
+from .api import commit_score_chunk, fail_score_commit, finish_score_commit
@@ -5,26 +5,96 @@ CSV import/export API for grades.
 import datetime
 import logging
 
+from django import forms
+from django.conf import settings
+from django.core.exceptions import BadRequest
 from django.http import HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.translation import gettext as _
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import conditional_page
 from django.views.generic import View
 
 from . import api
 
 log = logging.getLogger(__name__)
 
+# default number of characters of CSV gathered into each chunk of a streamed export
+EXPORT_CHUNK_SIZE = 64 * 1024
+# bytes allowed for multipart framing and form fields on top of an uploaded file
+UPLOAD_OVERHEAD = 64 * 1024
+# (processor argument, GET parameter) pairs for the grade range filters of exports
+GRADE_FILTER_PARAMS = (
+    ('subsection_grade_min', 'assignmentGradeMin'),
+    ('subsection_grade_max', 'assignmentGradeMax'),
+    ('course_grade_min', 'courseGradeMin'),
+    ('course_grade_max', 'courseGradeMax'),
+)
+
+
+class GradeFilterForm(forms.Form):
+    """
+    The grade range filters of an export, as percentages.
+    """
+
+    assignmentGradeMin = forms.FloatField(required=False)
+    assignmentGradeMax = forms.FloatField(required=False)
+    courseGradeMin = forms.FloatField(required=False)
+    courseGradeMax = forms.FloatField(required=False)
+
+
+def _grade_filters(query_params):
+    """
+    Return the grade range filters set in query_params, keyed by processor argument.
+
+    Raises BadRequest (a 400 response) if any of them is not a number.
+    """
+    form = GradeFilterForm(query_params)
+    if not form.is_valid():
+        raise BadRequest(form.errors.as_text())
+    return {argument: form.cleaned_data[param] for argument, param in GRADE_FILTER_PARAMS}
+
+
+def _chunked(lines, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Join the CSV lines of an export into chunks of about chunk_size characters.
+
+    Streaming one line at a time costs a write (and HTTP chunk) per learner.
+    """
+    chunk = []
+    size = 0
+    try:
+        for line in lines:
+            chunk.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield ''.join(chunk)
+    finally:
+        # if the download is aborted, close the export (and its database cursors) right away
+        close = getattr(lines, 'close', None)
+        if close:
+            close()
+
 
 class GradeOnlyExport(View):
     """
     CSV Export of grade information only. To be used by both bulk grade export and interventions.
     """
 
+    extra_filename = ''
+
     def __init__(self, **kwargs):
         """
         Configure initial state.
         """
         super().__init__(**kwargs)
         self.processor = None
-        self.extra_filename = ''
 
     def get_export_iterator(self, request):
         """
@@ -48,14 +118,13 @@ class GradeOnlyExport(View):
         """
         Create filename for export
         """
-        filename_elements = [course_id]
-
+        timestamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')
         if self.extra_filename:
-            filename_elements.append(self.extra_filename)
-        filename_elements.append(datetime.datetime.utcnow().isoformat())
-
-        return '-'.join(filename_elements) + '.csv'
+            return f'{course_id}-{self.extra_filename}-{timestamp}.csv'
+        return f'{course_id}-{timestamp}.csv'
 
+    # CSV compresses well, so compress the stream for clients that accept gzip
+    @method_decorator(gzip_page)
     def get(self, request, course_id, *args, **kwargs):
         """
         Export grades in CSV format.
@@ -68,8 +137,12 @@ class GradeOnlyExport(View):
         iterator = self.get_export_iterator(request)
         filename = self.get_export_filename(course_id)
 
-        response = StreamingHttpResponse(iterator, content_type='text/csv')
+        chunk_size = getattr(settings, 'BULK_GRADES_EXPORT_CHUNK_SIZE', EXPORT_CHUNK_SIZE)
+        response = StreamingHttpResponse(_chunked(iterator, chunk_size), content_type='text/csv')
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # let the first rows reach the client while the rest are computed, rather than buffering them in a proxy
+        response['X-Accel-Buffering'] = 'no'
+        patch_cache_control(response, no_cache=True)
 
         log.info('Exporting %s CSV for %s', course_id, self.__class__)
         return response
@@ -80,13 +153,33 @@ class GradeImportExport(GradeOnlyExport):
     CSV Grade import/export view.
     """
 
+    # CsrfViewMiddleware reads the whole body to find the form's token, so the
+    # CSRF check is made here instead, once the upload's size has been checked
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, course_id, *args, **kwargs):
+        """
+        Reject uploads too large to ever pass validation, before their body is read.
+        """
+        if request.method == 'POST':
+            try:
+                content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                content_length = 0
+            max_file_size = api.GradeCSVProcessor.max_file_size
+            if content_length > max_file_size + UPLOAD_OVERHEAD:
+                return JsonResponse(
+                    {'error_messages': [_('The CSV file must be under {} bytes').format(max_file_size)]},
+                    status=413,
+                )
+        return csrf_protect(super().dispatch)(request, course_id, *args, **kwargs)
+
     def post(self, request, course_id, *args, **kwargs):
         """
         Import grades from a CSV file.
         """
         result_id = request.POST.get('result_id', None)
         if result_id:
-            results = self.processor.get_deferred_result(result_id)
+            results = api.GradeCSVProcessor.get_deferred_result(result_id)
             if results.ready():
                 data = results.get()
                 log.info('Got results from celery %r', data)
@@ -125,6 +218,9 @@ class GradeImportExport(GradeOnlyExport):
         """
         Initialize GradeCSVProcessor.
         """
+        if request.POST.get('result_id'):
+            # polling a deferred commit only reads its celery result
+            return
         operation_id = request.GET.get('error_id', '')
         if operation_id:
             self.processor = api.GradeCSVProcessor.load(operation_id)
@@ -133,10 +229,6 @@ class GradeImportExport(GradeOnlyExport):
                 return HttpResponseForbidden()
             self.extra_filename = 'graded-results'
         else:
-            assignment_grade_max = request.GET.get('assignmentGradeMax')
-            assignment_grade_min = request.GET.get('assignmentGradeMin')
-            course_grade_min = request.GET.get('courseGradeMin')
-            course_grade_max = request.GET.get('courseGradeMax')
             self.processor = api.GradeCSVProcessor(
                 course_id=course_id,
                 user_id=request.user.id,
@@ -144,14 +236,9 @@ class GradeImportExport(GradeOnlyExport):
                 cohort=request.GET.get('cohort'),
                 subsection=request.GET.get('assignment'),
                 assignment_type=request.GET.get('assignmentType'),
-                subsection_grade_max=(float(assignment_grade_max)
-                                      if assignment_grade_max else None),
-                subsection_grade_min=(float(assignment_grade_min)
-                                      if assignment_grade_min else None),
-                course_grade_min=(float(course_grade_min) if course_grade_min else None),
-                course_grade_max=(float(course_grade_max) if course_grade_max else None),
                 excluded_course_roles=request.GET.getlist('excludedCourseRoles'),
                 active_only=True,
+                **_grade_filters(request.GET),
             )
 
 
@@ -160,6 +247,8 @@ class GradeOperationHistoryView(View):
     Collection View for history of grade override file uploads.
     """
 
+    # the history is polled, and rarely changes, so answer repeat requests with 304 Not Modified
+    @method_decorator(conditional_page)
     def get(self, request, course_id):
         """
         Get all previous times grades have been overwritten for this course.
@@ -189,21 +278,11 @@ class InterventionsExport(GradeOnlyExport):
         """
         Initialize InterventionCSVProcessor.
         """
-        assignment_grade_max = request.GET.get('assignmentGradeMax')
-        assignment_grade_min = request.GET.get('assignmentGradeMin')
-        course_grade_min = request.GET.get('courseGradeMin')
-        course_grade_max = request.GET.get('courseGradeMax')
-
         self.processor = api.InterventionCSVProcessor(
             course_id=course_id,
             _user=request.user,
             cohort=request.GET.get('cohort'),
             subsection=request.GET.get('assignment'),
             assignment_type=request.GET.get('assignmentType'),
-            subsection_grade_min=(float(assignment_grade_min)
-                                  if assignment_grade_min else None),
-            subsection_grade_max=(float(assignment_grade_max)
-                                  if assignment_grade_max else None),
-            course_grade_min=(float(course_grade_min) if course_grade_min else None),
-            course_grade_max=(float(course_grade_max) if course_grade_max else None)
+            **_grade_filters(request.GET),
         )
@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 from opaque_keys.edx.keys import UsageKey
 
 
@@ -48,6 +50,12 @@ class SubsectionGradeFactory:
 
 
 class CourseGradeFactory:
+    GradeResult = namedtuple('GradeResult', ['student', 'course_grade', 'error'])
+
+    def iter(self, users, course=None, collected_block_structure=None, course_key=None, force_update=False):
+        for user in users:
+            yield self.GradeResult(user, self.read(user, course_key=course_key), None)
+
     def read(
             self,
             user,
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-15 17:30
+
+from django.db import migrations, models
+import opaque_keys.edx.django.models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersistentCourseGrade',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField(db_index=True)),
+                ('course_id', opaque_keys.edx.django.models.CourseKeyField(max_length=255)),
+                ('percent_grade', models.FloatField()),
+                ('letter_grade', models.CharField(max_length=255, verbose_name='Letter grade for course')),
+            ],
+            options={
+                'unique_together': {('course_id', 'user_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import models
+from opaque_keys.edx.django.models import CourseKeyField
+
+
+class PersistentCourseGrade(models.Model):
+    """
+    .. no_pii:
+    """
+    user_id = models.IntegerField(blank=False, db_index=True)
+    course_id = CourseKeyField(blank=False, max_length=255)
+    percent_grade = models.FloatField(blank=False)
+    letter_grade = models.CharField('Letter grade for course', blank=False, max_length=255)
+
+    class Meta:
+        app_label = 'grades'
+        unique_together = [
+            ('course_id', 'user_id'),
+        ]
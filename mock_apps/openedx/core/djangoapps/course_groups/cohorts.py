@@ -1,2 +1,9 @@
 def get_cohort(course_id, user, assign=False):
     return {}
+
+
+def is_course_cohorted(course_key):
+    """
+    Every mock course is cohorted; patch this where it is imported to test a course which is not.
+    """
+    return True
@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.db import models
+from opaque_keys.edx.django.models import CourseKeyField
+
+
+class CourseUserGroup(models.Model):
+    """
+    .. no_pii:
+    """
+    name = models.CharField(max_length=255)
+    course_id = CourseKeyField(max_length=255, db_index=True)
+
+
+class CohortMembership(models.Model):
+    """
+    .. no_pii:
+    """
+    course_user_group = models.ForeignKey(CourseUserGroup, on_delete=models.CASCADE)
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    course_id = CourseKeyField(max_length=255)
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-15 17:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('student', '0002_auto_20210319_1345'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramEnrollment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_user_key', models.CharField(max_length=255, null=True)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='programcourseenrollment',
+            name='program_enrollment',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='student.programenrollment'),
+        ),
+    ]
@@ -42,18 +42,14 @@ class CourseEnrollment(models.Model):
         ordering = ('user', 'course_id')
 
 
-class ProgramEnrollment:
-    pass
+class ProgramEnrollment(models.Model):
+    user = models.ForeignKey(get_user_model(), null=True, on_delete=models.CASCADE)
+    external_user_key = models.CharField(max_length=255, null=True)
 
 
 class ProgramCourseEnrollment(models.Model):
     course_enrollment = models.ForeignKey(CourseEnrollment, on_delete=models.CASCADE)
-
-    @property
-    def program_enrollment(self):
-        program_enrollment = ProgramEnrollment()
-        program_enrollment.external_user_key = 'ext:%s' % self.course_enrollment.user_id
-        return program_enrollment
+    program_enrollment = models.ForeignKey(ProgramEnrollment, null=True, on_delete=models.CASCADE)
 
 
 class Profile(models.Model):
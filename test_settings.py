@@ -44,6 +44,8 @@ INSTALLED_APPS = (
     'super_csv',
     'courseware.apps.CoursewareConfig',
     'student',
+    'openedx.core.djangoapps.course_groups',
+    'lms.djangoapps.grades',
 )
 
 LOCALE_PATHS = [
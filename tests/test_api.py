@@ -11,14 +11,24 @@ from unittest.mock import MagicMock, Mock, patch
 
 import ddt
 import lms.djangoapps.grades.api as grades_api
+from courseware.models import StudentModule
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.files.base import ContentFile
-from django.test import TestCase
+from django.db import DatabaseError, connection
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from edx_django_utils.cache import RequestCache
+from lms.djangoapps.grades.models import PersistentCourseGrade
 from opaque_keys.edx.keys import UsageKey
-from student.models import CourseAccessRole, CourseEnrollment, Profile, ProgramCourseEnrollment
+from openedx.core.djangoapps.course_groups.models import CohortMembership, CourseUserGroup
+from student.models import CourseAccessRole, CourseEnrollment, Profile, ProgramCourseEnrollment, ProgramEnrollment
 from super_csv.csv_processor import ValidationError
+from super_csv.models import CSVOperation
 
 from bulk_grades import api
+from bulk_grades.models import ScoreOverrider
 
 
 class BaseTests(TestCase):
@@ -36,6 +46,10 @@ class BaseTests(TestCase):
         cls.learners = cls._make_enrollments()
         cls.audit_learner, cls.verified_learner, cls.masters_learner = cls.learners
 
+    def setUp(self):
+        super().setUp()
+        RequestCache.clear_all_namespaces()
+
     @classmethod
     def _make_enrollments(cls):
         return [cls._make_enrollment(name, name) for name in ['audit', 'verified', 'masters']]
@@ -46,7 +60,8 @@ class BaseTests(TestCase):
         Profile.objects.create(user=user, name=name)
         enroll = CourseEnrollment.objects.create(course_id=cls.course_id, user=user, mode=mode)
         if mode == 'masters':
-            ProgramCourseEnrollment.objects.create(course_enrollment=enroll)
+            program_enrollment = ProgramEnrollment.objects.create(user=user, external_user_key='ext:%s' % user.id)
+            ProgramCourseEnrollment.objects.create(course_enrollment=enroll, program_enrollment=program_enrollment)
         return user
 
     def _mock_graded_subsections(self):
@@ -113,10 +128,72 @@ class TestApi(BaseTests):
         score = api.get_score(self.usage_key, 11)
         assert score is None
 
+    def test_set_scores(self):
+        api.set_score(self.usage_key, self.audit_learner.id, 1, 22)
+        scores = {self.audit_learner.id: 5, str(self.verified_learner.id): 6, self.masters_learner.id: 7}
+        saved_modules = []
+
+        def module_saved(instance, **kwargs):  # pylint: disable=unused-argument
+            saved_modules.append(instance)
+
+        post_save.connect(module_saved, sender=StudentModule)
+        self.addCleanup(post_save.disconnect, module_saved, sender=StudentModule)
+        api.set_scores(self.usage_key, scores, 22, override_user_id=self.staff.id)
+        # every module is saved on its own, so the platform's handlers (such as its history) see it
+        assert sorted(int(module.student_id) for module in saved_modules) == sorted(learner.id for learner in self.learners)
+        result = api.get_scores(self.usage_key)
+        for learner, score in zip(self.learners, (5, 6, 7)):
+            assert result[learner.id]['score'] == score
+            assert result[learner.id]['max_grade'] == 22
+            assert result[learner.id]['who_last_graded'] == self.staff.username
+
+    def test_set_scores_negative_score(self):
+        with self.assertRaisesMessage(ValueError, 'score must be positive'):
+            api.set_scores(self.usage_key, {self.learner.id: -2}, 22)
+        assert api.get_score(self.usage_key, self.learner.id) is None
+
+    def test_get_scores_num_queries(self):
+        other_learners = (self.audit_learner, self.verified_learner)
+        for learner in other_learners:
+            api.set_score(self.usage_key, learner.id, 1, 22, override_user_id=self.learner.id)
+            api.set_score(self.usage_key, learner.id, 2, 22, override_user_id=self.staff.id)
+        api.set_score(self.usage_key, self.learner.id, 3, 22)
+        # the last overrider is read in the same query as the modules
+        with self.assertNumQueries(1):
+            scores = api.get_scores(self.usage_key)
+        assert {learner.id: scores[learner.id]['who_last_graded'] for learner in other_learners} == {
+            learner.id: self.staff.username for learner in other_learners
+        }
+        assert scores[self.learner.id]['who_last_graded'] == api.UNKNOWN_LAST_SCORE_OVERRIDER
+
+    def test_get_scores_without_state(self):
+        api.set_score(self.usage_key, self.learner.id, 3, 22)
+        assert 'state' in api.get_scores(self.usage_key)[self.learner.id]
+        scores = api.get_scores(self.usage_key, include_state=False)
+        assert 'state' not in scores[self.learner.id]
+        assert scores[self.learner.id]['score'] == 3
+
     def test_negative_score(self):
         with self.assertRaisesMessage(ValueError, 'score must be positive'):
             api.set_score(self.usage_key, self.learner.id, -2, 22, override_user_id=self.staff.id)
 
+    def test_get_enrollments_num_queries(self):
+        # one query for enrollments, users and profiles, and one for program enrollments
+        with self.assertNumQueries(2):
+            enrollments = list(api._get_enrollments(self.course_id))  # pylint: disable=protected-access
+        assert len(enrollments) == 3
+        assert [e['student_uid'] for e in enrollments] == [None, None, 'ext:%s' % self.masters_learner.id]
+        # users are loaded in full, since they are passed on to the grades api
+        with self.assertNumQueries(0):
+            assert [e['user'].email for e in enrollments] == [learner.email for learner in self.learners]
+
+    @patch('bulk_grades.api.ENROLLMENTS_CHUNK_SIZE', 2)
+    def test_get_enrollments_in_chunks(self):
+        # enrollments are streamed from one query, with a program enrollment query per chunk
+        with self.assertNumQueries(3):
+            enrollments = list(api._get_enrollments(self.course_id))  # pylint: disable=protected-access
+        assert [e['student_uid'] for e in enrollments] == [None, None, 'ext:%s' % self.masters_learner.id]
+
 
 @ddt.ddt
 class TestScoreProcessor(BaseTests):
@@ -154,12 +231,46 @@ class TestScoreProcessor(BaseTests):
             prev_points = row.split(',')[prev_points_index]
             assert prev_points == ''
 
+    def test_export_matches_rows(self):
+        api.set_score(self.usage_key, self.masters_learner.id, 3, 22, override_user_id=self.staff.id)
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key)
+        rows = list(processor.get_iterator())
+        assert rows == list(processor.get_iterator(rows=processor.get_rows_to_export()))
+        assert rows[-1].endswith(f',{self.staff.username},3.0,\r\n')
+
+    def test_export_cohorts(self):
+        cohort = CourseUserGroup.objects.create(name='cohort-a', course_id=self.course_id)
+        CohortMembership.objects.create(course_user_group=cohort, user=self.masters_learner, course_id=self.course_id)
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key)
+        # scores, enrollments with their cohorts, and program enrollments, however many learners there are
+        with self.assertNumQueries(3):
+            rows = list(processor.get_iterator())
+        cohort_index = rows[0].split(',').index('cohort')
+        cohorts = {row.split(',')[1]: row.split(',')[cohort_index] for row in rows[1:]}
+        assert cohorts == {
+            self.audit_learner.username: '',
+            self.verified_learner.username: '',
+            self.masters_learner.username: 'cohort-a',
+        }
+
+    @patch('bulk_grades.api.is_course_cohorted', return_value=False)
+    def test_export_not_cohorted(self, mock_is_cohorted):  # pylint: disable=unused-argument
+        cohort = CourseUserGroup.objects.create(name='cohort-a', course_id=self.course_id)
+        CohortMembership.objects.create(course_user_group=cohort, user=self.masters_learner, course_id=self.course_id)
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key)
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(processor.get_iterator())
+        # the cohort names are not read for a course which is not cohorted
+        assert not any('course_groups_cohortmembership' in query['sql'] for query in queries.captured_queries)
+        cohort_index = rows[0].split(',').index('cohort')
+        assert {row.split(',')[cohort_index] for row in rows[1:]} == {''}
+
     @ddt.data('somebody', api.UNKNOWN_LAST_SCORE_OVERRIDER)
     def test_export_prev_scores(self, expected_who_last_graded_value):
         with patch('bulk_grades.api.get_scores') as mocked_get_scores:
             mock_score_data = {
                 'score': '100',
-                'modified': datetime.datetime.now(),
+                'modified': datetime.datetime(2019, 7, 4, 9, 5, 30, tzinfo=datetime.timezone.utc),
                 'who_last_graded': expected_who_last_graded_value,
             }
             mocked_get_scores.return_value = {
@@ -174,10 +285,12 @@ class TestScoreProcessor(BaseTests):
         column_names = rows[0].split(',')
         prev_points_index = column_names.index('Previous Points')
         who_last_graded_index = column_names.index('who_last_graded')
+        date_last_graded_index = column_names.index('date_last_graded')
 
         for row in rows[1:]:
             row_data = row.split(',')
             assert row_data[prev_points_index] == '100.0'
+            assert row_data[date_last_graded_index] == '2019-07-04 09:05'
             assert row_data[who_last_graded_index] == expected_who_last_graded_value
 
     def test_validate(self):
@@ -211,6 +324,117 @@ class TestScoreProcessor(BaseTests):
         assert not processor.preprocess_row(row)
         assert not processor.preprocess_row(self._get_row(points=0))
 
+    def test_commit_in_batches(self):
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key, max_points=100, user_id=self.staff.id)
+        processor.commit_batch_size = 2
+        for rownum, learner in enumerate(self.learners, 1):
+            processor.stage.append((rownum, processor.preprocess_row(self._get_row(user_id=learner.id, points=rownum))))
+        with patch('bulk_grades.api.set_scores', wraps=api.set_scores) as mock_set_scores:
+            processor.commit()
+        assert mock_set_scores.call_count == 2
+        assert processor.saved_rows == 3
+        scores = api.get_scores(self.usage_key)
+        assert [scores[learner.id]['score'] for learner in self.learners] == [1, 2, 3]
+
+    @patch('lms.djangoapps.grades.api.task_compute_all_grades_for_course.apply_async')
+    def test_commit_deferred_in_chunks(self, mock_compute_grades):
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key, max_points=100, user_id=self.staff.id)
+        processor.size_to_defer = 1
+        processor.commit_batch_size = 2
+        for rownum, learner in enumerate(self.learners, 1):
+            processor.stage.append((rownum, processor.preprocess_row(self._get_row(user_id=learner.id, points=rownum))))
+        with patch('bulk_grades.api.commit_score_chunk.run', wraps=api.commit_score_chunk.run) as mock_chunk:
+            processor.commit()
+        assert mock_chunk.call_count == 2
+        mock_compute_grades.assert_called_once()
+        status = processor.status()
+        assert status['saved'] == 3
+        assert status['error_messages'] == []
+        scores = api.get_scores(self.usage_key)
+        assert [scores[learner.id]['score'] for learner in self.learners] == [1, 2, 3]
+        assert {score['who_last_graded'] for score in scores.values()} == {self.staff.username}
+
+    @patch('lms.djangoapps.grades.api.task_compute_all_grades_for_course.apply_async')
+    def test_fail_score_commit(self, mock_compute_grades):
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key, max_points=100, user_id=self.staff.id)
+        processor.stage.append((1, processor.preprocess_row(self._get_row(points=1))))
+        operation = processor.save()
+        api.fail_score_commit(None, DatabaseError('lost'), None, operation.id)
+        mock_compute_grades.assert_called_once()
+        failed_operation = CSVOperation.objects.latest('id')
+        assert failed_operation.operation == api.FAILED_COMMIT_OPERATION
+        processor = api.ScoreCSVProcessor.load(failed_operation.id)
+        assert list(processor.error_messages) == ['Saving the scores failed; some scores may not have been saved: lost']
+        assert processor.stage == []
+        # a failed commit is not listed with the committed uploads
+        assert not list(processor.get_committed_history())
+
+    @patch('bulk_grades.api.chord')
+    def test_commit_deferred_failure_callback(self, mock_chord):
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key, max_points=100, user_id=self.staff.id)
+        processor.size_to_defer = 1
+        for rownum, learner in enumerate(self.learners, 1):
+            processor.stage.append((rownum, processor.preprocess_row(self._get_row(user_id=learner.id, points=rownum))))
+        processor.commit()
+        finish = mock_chord.return_value.call_args[0][0]
+        operation = CSVOperation.objects.latest('id')
+        assert finish.options['link_error'] == [api.fail_score_commit.s(operation.id)]
+
+    @patch('lms.djangoapps.grades.api.task_compute_all_grades_for_course.apply_async')
+    def test_finish_score_commit_with_errors(self, mock_compute_grades):  # pylint: disable=unused-argument
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key, max_points=100, user_id=self.staff.id)
+        operation = processor.save()
+        status = api.finish_score_commit([{'saved': 2, 'errors': {}}, {'saved': 0, 'errors': {'broken': [3]}}], operation.id)
+        assert status['saved'] == 2
+        assert dict(api.ScoreCSVProcessor.load(CSVOperation.objects.latest('id').id).error_messages) == {'broken': [3]}
+
+    def test_commit_batch_failure(self):
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key, max_points=100)
+        processor.stage.append((1, processor.preprocess_row(self._get_row(points=1))))
+        with patch('bulk_grades.api.set_scores', side_effect=ValueError('broken')), \
+                patch('bulk_grades.api.set_score', side_effect=ValueError('broken')):
+            processor.commit()
+        assert processor.saved_rows == 0
+        assert processor.error_messages == {'broken': [1]}
+
+    def test_commit_batch_failure_rolls_back(self):
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key, max_points=100, user_id=self.staff.id)
+        for rownum, learner in enumerate(self.learners, 1):
+            processor.stage.append((rownum, processor.preprocess_row(self._get_row(user_id=learner.id, points=rownum))))
+        process_rows = api.ScoreCSVProcessor.process_rows
+
+        def fail_after_saving(self, rows):
+            process_rows(self, rows)
+            raise ValueError('batch broken')
+
+        with patch.object(api.ScoreCSVProcessor, 'process_rows', autospec=True, side_effect=fail_after_saving):
+            processor.commit()
+        assert processor.saved_rows == 3
+        assert processor.error_messages == {}
+        # the batch's writes were rolled back before its rows were retried
+        assert ScoreOverrider.objects.count() == 3
+
+    def test_commit_batch_failure_retries_rows(self):
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key, max_points=100, user_id=self.staff.id)
+        for rownum, learner in enumerate(self.learners, 1):
+            processor.stage.append((rownum, processor.preprocess_row(self._get_row(user_id=learner.id, points=rownum))))
+        bad_learner = self.learners[1]
+        original_set_score = api.set_score
+
+        def set_score(usage_key, student_id, *args, **kwargs):
+            if student_id == bad_learner.id:
+                raise ValueError('broken')
+            return original_set_score(usage_key, student_id, *args, **kwargs)
+
+        with patch('bulk_grades.api.set_scores', side_effect=ValueError('batch broken')), \
+                patch('bulk_grades.api.set_score', side_effect=set_score):
+            processor.commit()
+        assert processor.saved_rows == 2
+        assert processor.error_messages == {'broken': [2]}
+        scores = api.get_scores(self.usage_key)
+        assert bad_learner.id not in scores
+        assert [scores[learner.id]['score'] for learner in self.learners if learner != bad_learner] == [1, 3]
+
     def test_process(self):
         processor = api.ScoreCSVProcessor(block_id=self.usage_key, max_points=100)
         operation = processor.preprocess_row(self._get_row(points=1))
@@ -218,6 +442,21 @@ class TestScoreProcessor(BaseTests):
         processor.handle_undo = True
         assert processor.process_row(operation)[1]['score'] == 1
 
+    def test_process_rows_undo(self):
+        processor = api.ScoreCSVProcessor(block_id=self.usage_key, max_points=100, handle_undo=True)
+        api.set_score(self.usage_key, self.learner.id, 4, 100)
+        rows = [
+            processor.preprocess_row(self._get_row(points=7)),
+            processor.preprocess_row(self._get_row(user_id=self.audit_learner.id, points=8)),
+        ]
+        with patch('bulk_grades.api.get_scores', wraps=api.get_scores) as mock_get_scores:
+            results = processor.process_rows(rows)
+        # the previous scores of the whole batch are read at once
+        mock_get_scores.assert_called_once()
+        assert results[0][1]['new_points'] == 4
+        assert results[1] == (True, None)
+        assert api.get_score(self.usage_key, self.learner.id)['score'] == 7
+
 
 class MySubsectionClass(api.GradedSubsectionMixin):
     pass
@@ -239,6 +478,14 @@ class TestGradedSubsectionMixin(BaseTests):
         assert 'HOMEWORK_QUESTIONS' == subsections['homework'][1]
         assert 'LAB_QUESTIONS' == subsections['lab_ques'][1]
 
+    @patch('lms.djangoapps.grades.api.graded_subsections_for_course_id')
+    def test_get_graded_subsections_cached(self, mock_graded_subsections):
+        mock_graded_subsections.return_value = self._mock_graded_subsections()
+        for _ in range(2):
+            subsections = self.instance._get_graded_subsections(self.course_id)  # pylint: disable=protected-access
+            assert 2 == len(subsections)
+        mock_graded_subsections.assert_called_once_with(self.course_id)
+
     @patch('lms.djangoapps.grades.api.graded_subsections_for_course_id')
     def test_filter_subsection(self, mock_graded_subsections):
         mock_graded_subsections.return_value = self._mock_graded_subsections()
@@ -251,6 +498,20 @@ class TestGradedSubsectionMixin(BaseTests):
         assert 1 == len(subsections)
         assert 'LAB_QUESTIONS' == subsections['lab_ques'][1]
 
+    @patch('lms.djangoapps.grades.api.graded_subsections_for_course_id')
+    def test_filter_subsection_and_assignment_type(self, mock_graded_subsections):
+        mock_graded_subsections.return_value = self._mock_graded_subsections()
+        mock_graded_subsections.return_value[1].format = 'Lab'
+        filter_subsection = MagicMock()
+        filter_subsection.block_id = 'lab_questions'
+        get_graded_subsections = self.instance._get_graded_subsections  # pylint: disable=protected-access
+        assert ['lab_ques'] == list(get_graded_subsections(
+            self.course_id, filter_subsection=filter_subsection, filter_assignment_type='Lab'
+        ))
+        assert {} == get_graded_subsections(
+            self.course_id, filter_subsection=filter_subsection, filter_assignment_type='Homework'
+        )
+
     def test_subsection_column_names(self):
         short_subsection_ids = ['subsection-1', 'subsection-2', 'subsection-3']
         prefixes = ['grade', 'original_grade', 'previous_override', 'new_override']
@@ -321,6 +582,32 @@ class TestGradeProcessor(BaseTests):
         assert 'verified@example.com,,' in verified_row[0]
         assert len(rows) == self.NUM_USERS + 1
 
+    @patch('lms.djangoapps.grades.api.CourseGradeFactory.read', return_value=Mock(percent=0.50))
+    def test_export_cohorts(self, course_grade_factory_mock):  # pylint: disable=unused-argument
+        cohort = CourseUserGroup.objects.create(name='cohort-a', course_id=self.course_id)
+        CohortMembership.objects.create(course_user_group=cohort, user=self.masters_learner, course_id=self.course_id)
+        processor = api.GradeCSVProcessor(course_id=self.course_id)
+        rows = list(processor.get_iterator())
+        cohort_index = rows[0].split(',').index('cohort')
+        cohorts = {row.split(',')[1]: row.split(',')[cohort_index] for row in rows[1:]}
+        assert cohorts == {
+            self.audit_learner.username: '',
+            self.verified_learner.username: '',
+            self.masters_learner.username: 'cohort-a',
+        }
+
+    @patch('lms.djangoapps.grades.api.CourseGradeFactory.read', return_value=Mock(percent=0.50))
+    def test_export_matches_rows(self, course_grade_factory_mock):  # pylint: disable=unused-argument
+        processor = api.GradeCSVProcessor(course_id=self.course_id)
+        rows = list(processor.get_iterator())
+        dict_rows = list(processor.get_iterator(rows=processor.get_rows_to_export()))
+        assert rows == dict_rows
+        # changed columns fall back to writing the row dicts
+        processor.columns = ['username', 'track']
+        rows = list(processor.get_iterator())
+        assert rows[0] == 'username,track\r\n'
+        assert 'masters@example.com,masters\r\n' in rows
+
     @ddt.data(True, False)
     @patch('lms.djangoapps.grades.api.CourseGradeFactory.read', return_value=Mock(percent=0.50))
     def test_export__inactive_learner(self, active_only, course_grade_factory_mock):  # pylint: disable=unused-argument
@@ -332,7 +619,14 @@ class TestGradeProcessor(BaseTests):
             user=inactive_learner,
             mode='masters'
         )
-        ProgramCourseEnrollment.objects.create(course_enrollment=course_enrollment)
+        program_enrollment = ProgramEnrollment.objects.create(
+            user=inactive_learner,
+            external_user_key='ext:%s' % inactive_learner.id,
+        )
+        ProgramCourseEnrollment.objects.create(
+            course_enrollment=course_enrollment,
+            program_enrollment=program_enrollment,
+        )
         
         course_enrollment.is_active = False
         course_enrollment.save()
@@ -442,6 +736,139 @@ class TestGradeProcessor(BaseTests):
         rows = list(processor.get_iterator())
         self.assertEqual(len(rows), (self.NUM_USERS - 2)+1)
 
+    @patch('lms.djangoapps.grades.api.CourseGradeFactory.read', return_value=Mock(percent=0.70))
+    def test_course_grade_filters_persisted_grades(self, course_grade_factory_mock):
+        PersistentCourseGrade.objects.create(
+            user_id=self.audit_learner.id, course_id=self.course_id, percent_grade=0.2, letter_grade='',
+        )
+        PersistentCourseGrade.objects.create(
+            user_id=self.verified_learner.id, course_id=self.course_id, percent_grade=0.7, letter_grade='',
+        )
+        processor = api.GradeCSVProcessor(course_id=self.course_id, course_grade_min=60, course_grade_max=80)
+        rows = list(processor.get_iterator())
+        # the audit learner is excluded before their course grade is ever read
+        assert len(rows) == self.NUM_USERS
+        assert not any(self.audit_learner.username in row for row in rows)
+        assert course_grade_factory_mock.call_count == self.NUM_USERS - 1
+
+    @patch('lms.djangoapps.grades.api.get_subsection_grades')
+    @patch('lms.djangoapps.grades.api.graded_subsections_for_course_id', return_value=[])
+    @patch('lms.djangoapps.grades.api.CourseGradeFactory.read', return_value=Mock(percent=0.50))
+    def test_export_without_subsections(self, *mocks):
+        mock_subsection_grades = mocks[-1]
+        processor = api.GradeCSVProcessor(course_id=self.course_id)
+        rows = list(processor.get_iterator())
+        assert len(rows) == self.NUM_USERS + 1
+        assert rows[0] == ','.join(self.default_headers) + '\r\n'
+        mock_subsection_grades.assert_not_called()
+
+    @patch('lms.djangoapps.grades.api.get_subsection_grades', return_value={})
+    @patch('lms.djangoapps.grades.api.CourseGradeFactory.read')
+    def test_course_grade_filter_skips_subsection_grades(self, course_grade_factory_mock, mock_subsection_grades):
+        course_grade_factory_mock.side_effect = cycle((Mock(percent=0.50), Mock(percent=0.90)))
+        processor = api.GradeCSVProcessor(course_id=self.course_id, course_grade_min=70)
+        rows = list(processor.get_iterator())
+        assert len(rows) == 2
+        assert mock_subsection_grades.call_count == 1
+
+    @patch('lms.djangoapps.grades.api.CourseGradeFactory.iter')
+    def test_course_grade_error(self, course_grade_iter_mock):
+        course_grade_iter_mock.return_value = [
+            grades_api.CourseGradeFactory.GradeResult(self.audit_learner, None, ValueError('bad grade')),
+        ]
+        processor = api.GradeCSVProcessor(course_id=self.course_id, course_grade_min=10)
+        with self.assertRaisesMessage(ValueError, 'bad grade'):
+            list(processor.get_iterator())
+
+    @patch('lms.djangoapps.grades.api.CourseGradeFactory.read')
+    def test_export_without_course_grade_filters(self, course_grade_factory_mock):
+        processor = api.GradeCSVProcessor(course_id=self.course_id)
+        rows = list(processor.get_iterator())
+        assert len(rows) == self.NUM_USERS + 1
+        # the export has no course grade column, so course grades are not read
+        course_grade_factory_mock.assert_not_called()
+
+    @override_settings(BULK_GRADES_COURSE_GRADE_CACHE_TIMEOUT=300)
+    @patch('lms.djangoapps.grades.api.CourseGradeFactory.read', return_value=Mock(percent=0.5, letter_grade='C'))
+    def test_course_grades_cached(self, course_grade_factory_mock):
+        cache.clear()
+        processor = api.GradeCSVProcessor(course_id=self.course_id, course_grade_min=10)
+        rows = list(processor.get_iterator())
+        assert course_grade_factory_mock.call_count == self.NUM_USERS
+        assert rows == list(processor.get_iterator())
+        assert course_grade_factory_mock.call_count == self.NUM_USERS
+        # committing overrides invalidates the cached grades
+        processor.commit()
+        list(processor.get_iterator())
+        assert course_grade_factory_mock.call_count == self.NUM_USERS * 2
+
+    @override_settings(BULK_GRADES_HISTORY_CACHE_TIMEOUT=60)
+    @patch('super_csv.mixins.DeferrableMixin.get_committed_history', return_value=[{'id': 1}])
+    def test_committed_history_cached(self, mock_get_history):
+        cache.clear()
+        processor = api.GradeCSVProcessor(course_id=self.course_id)
+        assert processor.get_committed_history() == [{'id': 1}]
+        assert api.GradeCSVProcessor(course_id=self.course_id).get_committed_history() == [{'id': 1}]
+        assert mock_get_history.call_count == 1
+        # a commit adds to the history
+        processor.commit(running_task=True)
+        processor.get_committed_history()
+        assert mock_get_history.call_count == 2
+        # a deferred commit is only recorded in the history when the task saves the processor afterwards
+        processor.get_committed_history()
+        assert mock_get_history.call_count == 2
+        processor.save()
+        processor.get_committed_history()
+        assert mock_get_history.call_count == 3
+
+    @patch('lms.djangoapps.grades.api.override_subsection_grade')
+    def test_commit_in_batches(self, mock_override):
+        processor = api.GradeCSVProcessor(course_id=self.course_id)
+        processor.commit_batch_size = 2
+        for rownum, learner in enumerate(self.learners, 1):
+            processor.stage.append((rownum, {
+                'user_id': learner.id,
+                'course_id': self.course_id,
+                'new_override_grades': [(self.usage_key, rownum)],
+            }))
+        process_rows = api.GradeCSVProcessor.process_rows
+        with patch.object(api.GradeCSVProcessor, 'process_rows', autospec=True, side_effect=process_rows) as mock_process_rows:
+            processor.commit(running_task=True)
+        assert mock_process_rows.call_count == 2
+        assert mock_override.call_count == 3
+        assert processor.saved_rows == 3
+
+    @patch('lms.djangoapps.grades.api.override_subsection_grade')
+    def test_commit_row_failure(self, mock_override):
+        processor = api.GradeCSVProcessor(course_id=self.course_id)
+        for rownum, learner in enumerate(self.learners, 1):
+            processor.stage.append((rownum, {
+                'user_id': learner.id,
+                'course_id': self.course_id,
+                'new_override_grades': [(self.usage_key, rownum)],
+            }))
+        bad_learner = self.learners[1]
+
+        def override_subsection_grade(user_id, *args, **kwargs):  # pylint: disable=unused-argument
+            if user_id == bad_learner.id:
+                raise ValueError('broken')
+
+        mock_override.side_effect = override_subsection_grade
+        processor.commit(running_task=True)
+        assert mock_override.call_count == 3
+        assert processor.saved_rows == 2
+        assert processor.error_messages == {'broken': [2]}
+
+    @patch('lms.djangoapps.grades.api.override_subsection_grade')
+    def test_process_row_parsed_keys(self, mock_override):
+        processor = api.GradeCSVProcessor(course_id=self.course_id)
+        operation = processor.preprocess_row({'user_id': self.learner.id, 'new_override-85bb02db': '2'})
+        assert processor.process_row(operation) == (True, None)
+        _, course_key, usage_key = mock_override.call_args[0]
+        assert course_key == processor._course_key  # pylint: disable=protected-access
+        assert isinstance(usage_key, UsageKey)
+        assert usage_key.block_id.startswith('85bb02db')
+
     def test_preprocess_negative_number_error(self):
         processor = api.GradeCSVProcessor(course_id=self.course_id)
         row = {
@@ -0,0 +1,24 @@
+"""
+Tests for the `edx-bulk-grades` clients module.
+"""
+
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from bulk_grades.clients import LearnerAPIClient
+
+
+@override_settings(ANALYTICS_API_CLIENT={'url': 'http://analytics.example.com/api/v0', 'token': 'edx'})
+class TestLearnerAPIClient(TestCase):
+    """
+    Tests of the LearnerAPIClient.
+    """
+
+    @patch('requests.Session.request')
+    def test_timeout(self, mock_request):
+        mock_request.return_value.status_code = 200
+        mock_request.return_value.headers = {'content-type': 'application/json'}
+        mock_request.return_value.content = b'[]'
+        LearnerAPIClient(timeout=3).engagement_timelines.get()
+        assert mock_request.call_args.kwargs['timeout'] == 3
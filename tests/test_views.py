@@ -1,14 +1,19 @@
 """ Tests for bulk grade views """
+import gzip
+import re
 from unittest.mock import Mock, patch
 
 import lms.djangoapps.grades.api as grades_api
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.http import QueryDict
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
-from student.models import CourseAccessRole, CourseEnrollment, Profile, ProgramCourseEnrollment
+from edx_django_utils.cache import RequestCache
+from student.models import CourseAccessRole, CourseEnrollment, Profile, ProgramCourseEnrollment, ProgramEnrollment
 
 from bulk_grades.api import GradeCSVProcessor
+from bulk_grades.views import _chunked, _grade_filters
 
 
 class ViewTestsMixin:
@@ -25,6 +30,10 @@ class ViewTestsMixin:
         cls.learners = cls._make_enrollments()
         cls.audit_learner, cls.verified_learner, cls.masters_learner = cls.learners
 
+    def setUp(self):
+        super().setUp()
+        RequestCache.clear_all_namespaces()
+
     @classmethod
     def _make_enrollments(cls):
         return [cls._make_enrollment(name, name) for name in ['audit', 'verified', 'masters']]
@@ -35,7 +44,8 @@ class ViewTestsMixin:
         Profile.objects.create(user=user, name=name)
         enroll = CourseEnrollment.objects.create(course_id=cls.course_id, user=user, mode=mode)
         if mode == 'masters':
-            ProgramCourseEnrollment.objects.create(course_enrollment=enroll)
+            program_enrollment = ProgramEnrollment.objects.create(user=user, external_user_key='ext:%s' % user.id)
+            ProgramCourseEnrollment.objects.create(course_enrollment=enroll, program_enrollment=program_enrollment)
         return user
 
 
@@ -52,12 +62,56 @@ class GradeImportExportViewTests(ViewTestsMixin, TestCase):
         self.client.login(username=self.staff.username, password=self.password)
         response = self.client.get(reverse('bulk_grades', args=[self.course_id]))
         self.assertEqual(response.status_code, 200)
-        data = [row for row in response.streaming_content]
+        data = b''.join(response.streaming_content).decode().splitlines()
         self.assertEqual(len(data), 4)
         # The inactive user should not be included in the grade CSV export
         for row in data:
             self.assertNotIn(inactive_learner.username, str(row))
 
+    @patch('lms.djangoapps.grades.api.CourseGradeFactory.read', return_value=Mock(percent=0.50))
+    def test_get_gzip(self, mock_grade_factory):
+        self.client.login(username=self.staff.username, password=self.password)
+        response = self.client.get(reverse('bulk_grades', args=[self.course_id]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+        self.assertIn('no-cache', response['Cache-Control'])
+        data = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(data), 4)
+
+    def test_grade_filters(self):
+        assert _grade_filters(QueryDict('assignmentGradeMin=50&courseGradeMax=90.5&courseGradeMin=')) == {
+            'subsection_grade_min': 50.0,
+            'subsection_grade_max': None,
+            'course_grade_min': None,
+            'course_grade_max': 90.5,
+        }
+
+    @override_settings(BULK_GRADES_EXPORT_CHUNK_SIZE=1)
+    @patch('lms.djangoapps.grades.api.CourseGradeFactory.read', return_value=Mock(percent=0.50))
+    def test_get_chunk_size(self, mock_grade_factory):  # pylint: disable=unused-argument
+        self.client.login(username=self.staff.username, password=self.password)
+        response = self.client.get(reverse('bulk_grades', args=[self.course_id]))
+        # every line fills a chunk
+        self.assertEqual(len(list(response.streaming_content)), 4)
+
+    def test_get_bad_grade_filter(self):
+        self.client.login(username=self.staff.username, password=self.password)
+        response = self.client.get(reverse('bulk_grades', args=[self.course_id]), {'courseGradeMin': 'lots'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_chunked(self):
+        lines = ['a,b\r\n', 'c,d\r\n', 'e,f\r\n']
+        assert list(_chunked(lines, chunk_size=10)) == ['a,b\r\nc,d\r\n', 'e,f\r\n']
+        assert not list(_chunked([]))
+
+    def test_chunked_closes_lines(self):
+        lines = Mock(__iter__=Mock(return_value=iter(['a,b\r\n'] * 3)))
+        chunks = _chunked(lines, chunk_size=1)
+        next(chunks)
+        chunks.close()
+        lines.close.assert_called_once_with()
+
     @patch('lms.djangoapps.grades.api.CourseGradeFactory.read', return_value=Mock(percent=0.50))
     def test_get_filter_role(self, mock_grade_factory):
         role_to_exclude = 'ROLE_TO_EXCLUDE'
@@ -72,7 +126,7 @@ class GradeImportExportViewTests(ViewTestsMixin, TestCase):
             {'excludedCourseRoles': [role_to_exclude]},
         )
         self.assertEqual(response.status_code, 200)
-        data = [row for row in response.streaming_content]
+        data = b''.join(response.streaming_content).decode().splitlines()
         # audit_learner should not be included in the grade CSV export
         for row in data:
             self.assertNotIn(self.audit_learner.username, str(row))
@@ -122,6 +176,40 @@ class GradeImportExportViewTests(ViewTestsMixin, TestCase):
             }
         )
 
+    @patch.object(GradeCSVProcessor, 'get_deferred_result')
+    @patch.object(GradeCSVProcessor, '__init__')
+    def test_post_poll_result(self, mock_init, mock_get_result):
+        mock_get_result.return_value.ready.return_value = False
+        self.client.login(username=self.staff.username, password=self.password)
+        response = self.client.post(reverse('bulk_grades', args=[self.course_id]), {'result_id': 'abc'})
+        self.assertEqual(response.json(), {'waiting': True, 'result_id': 'abc'})
+        mock_get_result.assert_called_once_with('abc')
+        # polling does not build a processor
+        mock_init.assert_not_called()
+
+        mock_get_result.return_value.ready.return_value = True
+        mock_get_result.return_value.get.return_value = {'saved': 3}
+        response = self.client.post(reverse('bulk_grades', args=[self.course_id]), {'result_id': 'abc'})
+        self.assertEqual(response.json(), {'saved': 3})
+
+    @patch.object(GradeCSVProcessor, 'process_file')
+    def test_post_too_large(self, mock_process_file):
+        csv_file = SimpleUploadedFile(
+            'test_file.csv', b'x' * (GradeCSVProcessor.max_file_size + 128 * 1024), content_type='text/csv',
+        )
+        self.client.login(username=self.staff.username, password=self.password)
+        response = self.client.post(reverse('bulk_grades', args=[self.course_id]), {'csv': csv_file})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(len(response.json()['error_messages']), 1)
+        mock_process_file.assert_not_called()
+
+    def test_post_csrf(self):
+        csv_file = SimpleUploadedFile('test_file.csv', b'bad', content_type='text/csv')
+        client = Client(enforce_csrf_checks=True)
+        client.login(username=self.staff.username, password=self.password)
+        response = client.post(reverse('bulk_grades', args=[self.course_id]), {'csv': csv_file})
+        self.assertEqual(response.status_code, 403)
+
     def test_post_error(self):
         # Given bad CSV content
         csv_content = 'bad'
@@ -163,6 +251,14 @@ class GradeOperationHistoryViewTests(ViewTestsMixin, TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), mocked_value)
 
+    @patch.object(GradeCSVProcessor, 'get_committed_history', return_value=[{'id': 1}])
+    def test_get_not_modified(self, mock_get_history):  # pylint: disable=unused-argument
+        url = reverse('bulk_grades.history', args=[self.course_id])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
 
 class InterventionsExportViewTests(ViewTestsMixin, TestCase):
 
@@ -190,5 +286,9 @@ class InterventionsExportViewTests(ViewTestsMixin, TestCase):
         self.client.login(username=self.staff.username, password=self.password)
         response = self.client.get(reverse('interventions', args=[self.course_id]))
         self.assertEqual(response.status_code, 200)
-        data = [row for row in response.streaming_content]
+        self.assertRegex(
+            response['Content-Disposition'],
+            rf'^attachment; filename="{re.escape(self.course_id)}-intervention-\d{{8}}T\d{{6}}\.csv"$',
+        )
+        data = b''.join(response.streaming_content).decode().splitlines()
         self.assertEqual(len(data), 3)